@@ -1,34 +1,168 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
 
+import io
 import json
-from collections import defaultdict
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from functools import cached_property
+from itertools import groupby
+from operator import attrgetter
 from pathlib import Path
 from textwrap import indent
+from types import SimpleNamespace
 
 import click
 from clk.config import config
-from clk.decorators import (argument, command, flag, group, option,
-                            table_fields, table_format, use_settings)
-from clk.lib import Spinner, TablePrinter, call, get_keyring
+from clk.decorators import argument, flag, group, option, table_fields, table_format
+from clk.lib import Spinner, TablePrinter, get_keyring
 from clk.log import get_logger
-from clk.types import DynamicChoice
 
+import requests
 from gitlab import Gitlab
+from gitlab.exceptions import GitlabHttpError, GitlabListError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # requests (and hence python-gitlab) decodes every API response through
+    # this module reference. orjson decodes roughly twice as fast as the
+    # stdlib json, which adds up on walks that pull MBs of JSON, and its
+    # JSONDecodeError subclasses the stdlib one so the error paths still work.
+    # Only the decode side is swapped: requests calls dumps with kwargs like
+    # allow_nan that orjson.dumps does not accept.
+    requests.models.complexjson = SimpleNamespace(loads=orjson.loads, dumps=json.dumps)
 
 LOGGER = get_logger(__name__)
 
+DEFAULT_CONCURRENCY = 8
+# 100 is the maximum page size allowed by the GitLab API
+PER_PAGE = 100
+CACHE_VALIDITY = 24 * 3600
+# built once at module load so that the command decorators don't rebuild them
+# on every recipe discovery
+FIELDS_ID_NAME = ("id", "name")
+FIELDS_NAME_MEMBERS_WEB_URL = ("name", "members_web_url")
+
+CachedMember = namedtuple("CachedMember", ["id", "name", "username"])
+CachedNode = namedtuple("CachedNode", ["id", "name", "web_url", "members"])
+AsyncNode = namedtuple("AsyncNode", ["id", "name", "explicit_members", "implicit_members"])
+
+
+def cache_root():
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "clk" / "gitlab"
+
+
+# an unpaginated GraphQL connection is silently capped at 100 nodes, so the
+# member connections carry a pageInfo and the extra pages are fetched with the
+# follow-up queries below
+GRAPHQL_MEMBER_FIELDS = "pageInfo { hasNextPage endCursor } nodes { user { id name username } }"
+GRAPHQL_MEMBERS = f"(first: 100) {{ {GRAPHQL_MEMBER_FIELDS} }}"
+GRAPHQL_ROOT_GROUP_QUERY = f"""
+query rootGroup($fullPath: ID!) {{
+  group(fullPath: $fullPath) {{
+    id name webUrl fullPath
+    groupMembers{GRAPHQL_MEMBERS}
+  }}
+}}
+"""
+GRAPHQL_SUBGROUPS_QUERY = f"""
+query descendantGroups($fullPath: ID!, $cursor: String) {{
+  group(fullPath: $fullPath) {{
+    descendantGroups(first: 100, after: $cursor) {{
+      pageInfo {{ hasNextPage endCursor }}
+      nodes {{
+        id name webUrl fullPath
+        groupMembers{GRAPHQL_MEMBERS}
+      }}
+    }}
+  }}
+}}
+"""
+GRAPHQL_PROJECTS_QUERY = f"""
+query descendantProjects($fullPath: ID!, $cursor: String) {{
+  group(fullPath: $fullPath) {{
+    projects(includeSubgroups: true, first: 100, after: $cursor) {{
+      pageInfo {{ hasNextPage endCursor }}
+      nodes {{
+        id name webUrl fullPath
+        group {{ fullPath }}
+        projectMembers{GRAPHQL_MEMBERS}
+      }}
+    }}
+  }}
+}}
+"""
+GRAPHQL_GROUP_MEMBERS_QUERY = f"""
+query groupMembers($fullPath: ID!, $cursor: String) {{
+  group(fullPath: $fullPath) {{
+    groupMembers(first: 100, after: $cursor) {{ {GRAPHQL_MEMBER_FIELDS} }}
+  }}
+}}
+"""
+GRAPHQL_PROJECT_MEMBERS_QUERY = f"""
+query projectMembers($fullPath: ID!, $cursor: String) {{
+  project(fullPath: $fullPath) {{
+    projectMembers(first: 100, after: $cursor) {{ {GRAPHQL_MEMBER_FIELDS} }}
+  }}
+}}
+"""
+GRAPHQL_MEMBER_QUERIES = {
+    "groupMembers": ("group", GRAPHQL_GROUP_MEMBERS_QUERY),
+    "projectMembers": ("project", GRAPHQL_PROJECT_MEMBERS_QUERY),
+}
+
 
 class GitlabConfig:
 
     def __init__(self, url, private_token):
-        self.api = Gitlab(url=url, private_token=private_token)
+        self.url = url
+        # a single session reuses the warm TCP+TLS connections across all the
+        # API calls. The pools are sized to accommodate the concurrent walks.
+        session = requests.Session()
+        session.mount(
+            "https://",
+            HTTPAdapter(pool_connections=32,
+                        pool_maxsize=32,
+                        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])))
+        self.session = session
+        self.api = Gitlab(url=url, private_token=private_token, session=session, per_page=PER_PAGE)
+        # in-process memo of the walk listings, keyed on group id, so that
+        # chained walks within one run don't refetch the same nodes
+        self.subgroups_memo = {}
+        self.projects_memo = {}
+        self.jobs_memo = {}
+
+    def graphql(self, query, **variables):
+        token = self.api.private_token
+        response = self.session.post(self.url.rstrip("/") + "/api/graphql",
+                                     json={"query": query, "variables": variables},
+                                     headers={"Authorization": f"Bearer {token}"} if token else {})
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get("errors"):
+            raise GitlabHttpError(f"GraphQL query failed: {payload['errors']}")
+        return payload["data"]
 
 
 def get_token():
     res = get_keyring().get_password("click-project", "gitlab-token")
     if res:
-        return json.loads(res)[1]
+        loads = json.loads if orjson is None else orjson.loads
+        return loads(res)[1]
 
 
 @group()
@@ -42,77 +176,517 @@ def gitlab(private_token, url, ask_token):
     config.gitlab = GitlabConfig(url, private_token)
 
 
-def walk_subgroups(group):
-    yield group
-    for subgroup in group.subgroups.list(as_list=False):
-        subgroup = config.gitlab.api.groups.get(subgroup.id)
-        yield from walk_subgroups(subgroup)
+# the orderings GitLab supports for keyset pagination: /projects only with
+# order_by=id, /groups only with order_by=name. The other listing endpoints
+# (subgroups, group projects, members, ...) only support offset pagination.
+KEYSET_ORDERINGS = {
+    "GroupManager": "name",
+    "ProjectManager": "id",
+}
+# endpoints that rejected keyset at runtime, so we don't pay a failed request
+# per listing on instances older than the documentation says
+keyset_rejected = set()
+
+
+def keyset_list(manager, **kwargs):
+    """List with keyset pagination when the endpoint supports it
+
+Keyset pagination keeps the cost of fetching a page constant however deep the
+page is, whereas offset pagination makes the server scan the rows of all the
+previous pages. Only the first page is guarded: a rejection falls back to
+offset pagination (and is remembered), while a transient error on a later
+page propagates instead of silently restarting the listing with duplicates.
+    """
+    kind = type(manager).__name__
+    order_by = KEYSET_ORDERINGS.get(kind)
+    if order_by is not None and kind not in keyset_rejected:
+        try:
+            # python-gitlab fetches the first page right away, so the
+            # rejection shows up here and not during the iteration
+            items = manager.list(as_list=False, per_page=PER_PAGE, pagination="keyset", order_by=order_by,
+                                 sort="asc", **kwargs)
+        except (GitlabHttpError, GitlabListError):
+            keyset_rejected.add(kind)
+        else:
+            yield from items
+            return
+    yield from manager.list(as_list=False, per_page=PER_PAGE, **kwargs)
+
+
+def as_group(subgroup):
+    """Upgrade a listed subgroup into a full featured Group without a network hit
+
+The objects returned by group.subgroups.list carry all the attributes we
+display but lack the managers (subgroups, projects, members, ...) of a Group.
+lazy=True builds the stub without the extra GET, and we feed it the attributes
+we already got from the listing.
+    """
+    group = config.gitlab.api.groups.get(subgroup.id, lazy=True)
+    group._update_attrs(subgroup.attributes)
+    return group
+
+
+def as_project(listed_project):
+    """Upgrade a listed project into a full featured Project without a network hit
+
+Same trick as as_group, for the objects returned by group.projects.list.
+    """
+    project = config.gitlab.api.projects.get(listed_project.id, lazy=True)
+    project._update_attrs(listed_project.attributes)
+    return project
 
 
-def walk_projects(group):
-    for group in walk_subgroups(group):
-        for project in group.projects.list(as_list=False):
-            yield config.gitlab.api.projects.get(project.id)
+class IncludePattern:
+    """Glob pattern on group full paths, used to prune the subgroup walk
 
+The literal segments of the pattern are forwarded as server-side search terms
+so that the pruned siblings are not even fetched, and the walk only descends
+into groups whose path can still be the prefix of a match.
+    """
 
-def walk_group_and_projects(group):
-    for group in walk_subgroups(group):
+    def __init__(self, pattern):
+        self.pattern = pattern.strip("/")
+        self.segments = self.pattern.split("/")
+
+    def matches(self, path):
+        return fnmatch(path.strip("/"), self.pattern)
+
+    def may_descend(self, path):
+        parts = path.strip("/").split("/")
+        for part, segment in zip(parts, self.segments):
+            if segment == "**":
+                return True
+            if not fnmatch(part, segment):
+                return False
+        return len(parts) < len(self.segments)
+
+    def search_term(self, path):
+        """Server-side search term for the children of the group at path"""
+        depth = len(path.strip("/").split("/"))
+        if depth < len(self.segments):
+            segment = self.segments[depth]
+            if not any(character in segment for character in "*?["):
+                return segment
+        return None
+
+
+@contextmanager
+def buffered_stdout():
+    """Temporarily buffer sys.stdout
+
+Every print/echo otherwise potentially triggers a write syscall, which is
+fine interactively but gets painful when the output of a big walk is
+redirected to a file or a pipe. Buffering cuts the syscalls by a couple of
+orders of magnitude; the buffer is flushed when leaving the context.
+    """
+    if not hasattr(sys.stdout, "buffer") or sys.stdout.isatty():
+        # interactive users want to see the walk progress as it happens, and
+        # a replaced stdout is left alone
+        yield
+        return
+    initial = sys.stdout
+    wrapper = io.TextIOWrapper(initial.buffer, line_buffering=False, write_through=False)
+    sys.stdout = wrapper
+    try:
+        yield
+    finally:
+        sys.stdout = initial
+        wrapper.flush()
+        # don't let the wrapper close the real stdout when collected
+        wrapper.detach()
+
+
+def prefetched(iterable, ahead=1):
+    """Iterate while a background thread fetches the next items
+
+python-gitlab's paginated iterators only fetch page N+1 once page N is
+exhausted, so network and compute strictly serialize. A single puller thread
+keeps up to ahead pages worth of items in a bounded queue, hiding the fetch
+of the next page behind the processing of the current one.
+    """
+    items = queue.Queue(maxsize=ahead * PER_PAGE)
+    end = object()
+
+    def pull():
+        try:
+            for item in iterable:
+                items.put(item)
+            items.put(end)
+        except Exception as exception:
+            items.put(exception)
+
+    threading.Thread(target=pull, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is end:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def list_subgroups(group, search=None):
+    memo = config.gitlab.subgroups_memo
+    key = (group.id, search)
+    if key not in memo:
+        kwargs = {"search": search} if search else {}
+        memo[key] = [as_group(subgroup) for subgroup in keyset_list(group.subgroups, **kwargs)]
+    return memo[key]
+
+
+def list_group_projects(group):
+    memo = config.gitlab.projects_memo
+    if group.id not in memo:
+        memo[group.id] = [as_project(project) for project in keyset_list(group.projects)]
+    return memo[group.id]
+
+
+def async_walk_members(group_id, concurrency=DEFAULT_CONCURRENCY, only_explicit=False, include=None):
+    """Walk the tree with aiohttp, multiplexing the API calls on one event loop
+
+A single threaded asyncio loop keeps hundreds of requests in flight for a
+fraction of the memory of a thread pool. We hit the REST endpoints directly
+and return lightweight AsyncNode tuples, in the same breadth-first order as
+walk_group_and_projects, pruned by the same include pattern.
+    """
+    import asyncio
+
+    import aiohttp
+
+    api_url = config.gitlab.url.rstrip("/") + "/api/v4"
+    # anonymous walks of public groups are allowed, so only send the token
+    # header when there is one (aiohttp rejects None header values)
+    token = config.gitlab.api.private_token
+    headers = {"PRIVATE-TOKEN": token} if token else {}
+
+    async def get(session, path, **params):
+        async with session.get(api_url + path, params=params) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_all(session, path, **params):
+        result = []
+        page = 1
+        while True:
+            chunk = await get(session, path, per_page=PER_PAGE, page=page, **params)
+            result.extend(chunk)
+            if len(chunk) < PER_PAGE:
+                return result
+            page += 1
+
+    def as_members(data):
+        return [CachedMember(member["id"], member["name"], member["username"]) for member in data]
+
+    async def members_of(session, kind, id):
+        explicit = as_members(await get_all(session, f"/{kind}/{id}/members"))
+        implicit = [] if only_explicit else as_members(await get_all(session, f"/{kind}/{id}/members/all"))
+        return explicit, implicit
+
+    async def expand(session, group):
+        """Fetch everything about one group, fanning out the independent calls"""
+        search = include.search_term(group["full_path"]) if include else None
+        subgroups_params = {"search": search} if search else {}
+        if include is not None and not include.matches(group["full_path"]):
+            # pruned group: only its subgroups matter, to keep descending
+            return await get_all(session, f"/groups/{group['id']}/subgroups", **subgroups_params), []
+        subgroups, projects, group_members = await asyncio.gather(
+            get_all(session, f"/groups/{group['id']}/subgroups", **subgroups_params),
+            get_all(session, f"/groups/{group['id']}/projects"),
+            members_of(session, "groups", group["id"]),
+        )
+        project_members = await asyncio.gather(
+            *[members_of(session, "projects", project["id"]) for project in projects])
+        nodes = [AsyncNode(group["id"], group["name"], *group_members)]
+        nodes.extend(
+            AsyncNode(project["id"], project["name"], *members)
+            for project, members in zip(projects, project_members))
+        return subgroups, nodes
+
+    async def walk():
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+            nodes = []
+            level = [await get(session, f"/groups/{group_id}")]
+            while level:
+                next_level = []
+                for subgroups, level_nodes in await asyncio.gather(
+                        *[expand(session, group) for group in level]):
+                    nodes.extend(level_nodes)
+                    next_level.extend(subgroup for subgroup in subgroups
+                                      if include is None or include.may_descend(subgroup["full_path"]))
+                level = next_level
+            return nodes
+
+    return asyncio.run(walk())
+
+
+def walk_subgroups(group, concurrency=DEFAULT_CONCURRENCY, include=None):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def expand(group):
+            search = include.search_term(group.full_path) if include else None
+            return list_subgroups(group, search=search)
+
+        if include is None or include.matches(group.full_path):
+            yield group
+        level = [group]
+        while level:
+            next_level = []
+            # the API calls are network bound, so listing the subgroups of the
+            # whole level in parallel makes the walk much faster. executor.map
+            # keeps the submission order, hence the walk stays deterministic.
+            for subgroups in executor.map(expand, level):
+                for subgroup in subgroups:
+                    if include is None or include.matches(subgroup.full_path):
+                        yield subgroup
+                    if include is None or include.may_descend(subgroup.full_path):
+                        next_level.append(subgroup)
+            level = next_level
+
+
+def walk_projects(group, concurrency=DEFAULT_CONCURRENCY, include=None):
+    for group in walk_subgroups(group, concurrency=concurrency, include=include):
+        yield from list_group_projects(group)
+
+
+def walk_group_and_projects(group, concurrency=DEFAULT_CONCURRENCY, include=None):
+    for group in walk_subgroups(group, concurrency=concurrency, include=include):
         yield group
-        for project in group.projects.list(as_list=False):
-            yield config.gitlab.api.projects.get(project.id)
+        yield from list_group_projects(group)
 
 
 class GitlabGroupConfig:
 
-    def __init__(self, group_id):
+    def __init__(self, group_id, concurrency=DEFAULT_CONCURRENCY, refresh_cache=False, include=None):
         self.group = config.gitlab.api.groups.get(group_id)
+        self.concurrency = concurrency
+        self.refresh_cache = refresh_cache
+        self.include = IncludePattern(include) if include else None
+
+    def walk_groups(self):
+        yield from walk_subgroups(self.group, concurrency=self.concurrency, include=self.include)
 
     def walk_projects(self):
-        yield from walk_projects(self.group)
+        yield from walk_projects(self.group, concurrency=self.concurrency, include=self.include)
 
     def walk_group_and_projects(self):
-        yield from walk_group_and_projects(self.group)
+        yield from walk_group_and_projects(self.group, concurrency=self.concurrency, include=self.include)
+
+    @property
+    def cache_path(self):
+        return cache_root() / f"{self.group.id}.pkl"
+
+    def _cache_key(self):
+        return (self.group.id, config.gitlab.url, PER_PAGE, self.include.pattern if self.include else None)
+
+    def _load_cache(self):
+        if self.refresh_cache or not self.cache_path.exists():
+            return None
+        if time.time() - self.cache_path.stat().st_mtime > CACHE_VALIDITY:
+            return None
+        try:
+            key, nodes = pickle.loads(self.cache_path.read_bytes())
+        except Exception:
+            LOGGER.warning(f"Could not read the cache in {self.cache_path}, ignoring it")
+            return None
+        if key != self._cache_key():
+            return None
+        return nodes
+
+    def _save_cache(self, nodes):
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_path.write_bytes(pickle.dumps((self._cache_key(), nodes)))
+
+    def walk_group_and_projects_members(self):
+        """Walk the tree, yielding for each node its explicit members
+
+The walk goes through GraphQL when the instance supports it, falling back on
+the REST walk otherwise, and the result is persisted on disk either way so
+that subsequent runs don't pay the full walk again. Only the attributes we
+display are kept (as CachedNode / CachedMember tuples), not the full API
+objects.
+        """
+        nodes = self._load_cache()
+        if nodes is not None:
+            LOGGER.debug(f"Using the cached walk from {self.cache_path}")
+            yield from nodes
+            return
+        try:
+            nodes = list(self.graphql_walk_members())
+        except (GitlabHttpError, requests.RequestException) as exception:
+            LOGGER.debug(f"GraphQL walk not available ({exception}), falling back on the REST walk")
+            nodes = None
+        if nodes is None:
+            nodes = []
+            for node in prefetched(self.walk_group_and_projects()):
+                node = CachedNode(
+                    node.id, node.name, node.web_url,
+                    [
+                        CachedMember(member.id, member.name, member.username)
+                        for member in node.members.list(as_list=False, per_page=PER_PAGE)
+                    ])
+                nodes.append(node)
+                yield node
+            self._save_cache(nodes)
+            return
+        self._save_cache(nodes)
+        yield from nodes
+
+    def graphql_walk_members(self):
+        """Fetch the whole member walk in a handful of GraphQL queries
+
+The REST walk pays one request per node, whereas the GraphQL API returns the
+descendant groups and projects together with their members 100 at a time, so
+the whole tree usually comes back in a few round-trips. Yields the same
+CachedNode tuples as walk_group_and_projects_members, filtered client side by
+the include pattern like the REST walk: a group when its path matches, a
+project when the path of its group does.
+        """
+
+        def gid(value):
+            # GraphQL ids look like gid://gitlab/Project/1234
+            return int(value.rsplit("/", 1)[-1])
+
+        def fetch(kind, query, **variables):
+            owner = config.gitlab.graphql(query, **variables)[kind]
+            if owner is None:
+                # GraphQL answers 200 with a null group for token types or
+                # visibilities that REST accepts; treat it like any other
+                # GraphQL failure so the REST fallback engages
+                raise GitlabHttpError(f"GraphQL returned no {kind} for {variables['fullPath']}")
+            return owner
+
+        def as_members(connection):
+            return [
+                CachedMember(gid(member["user"]["id"]), member["user"]["name"], member["user"]["username"])
+                for member in connection["nodes"]
+            ]
+
+        def all_members(node, members_key):
+            connection = node[members_key]
+            members = as_members(connection)
+            kind, query = GRAPHQL_MEMBER_QUERIES[members_key]
+            while connection["pageInfo"]["hasNextPage"]:
+                connection = fetch(kind, query, fullPath=node["fullPath"],
+                                   cursor=connection["pageInfo"]["endCursor"])[members_key]
+                members.extend(as_members(connection))
+            return members
+
+        def as_node(node, members_key):
+            return CachedNode(gid(node["id"]), node["name"], node["webUrl"], all_members(node, members_key))
+
+        def paginate(query, connection):
+            cursor = None
+            while True:
+                page = fetch("group", query, fullPath=self.group.full_path, cursor=cursor)[connection]
+                yield from page["nodes"]
+                if not page["pageInfo"]["hasNextPage"]:
+                    return
+                cursor = page["pageInfo"]["endCursor"]
+
+        def included(path):
+            return self.include is None or self.include.matches(path)
+
+        root = fetch("group", GRAPHQL_ROOT_GROUP_QUERY, fullPath=self.group.full_path)
+        if included(root["fullPath"]):
+            yield as_node(root, "groupMembers")
+        for node in paginate(GRAPHQL_SUBGROUPS_QUERY, "descendantGroups"):
+            if included(node["fullPath"]):
+                yield as_node(node, "groupMembers")
+        for node in paginate(GRAPHQL_PROJECTS_QUERY, "projects"):
+            if included(node["group"]["fullPath"]):
+                yield as_node(node, "projectMembers")
 
 
 @gitlab.group()
 @option("--group-id", help="The id of the group to consider")
-def group(group_id):
+@option("--concurrency",
+        help="How many API calls to run in parallel when walking the group tree",
+        type=int,
+        default=DEFAULT_CONCURRENCY)
+@flag("--refresh-cache/--no-refresh-cache", help="Ignore the cached walks and fetch the tree again")
+@option("--include", help="Only walk the groups whose full path matches this glob pattern (like mygroup/**)")
+def group(group_id, concurrency, refresh_cache, include):
     """Manipulate the given group"""
     if group_id is None:
         raise click.UsageError("You must provide a group id, run the groups command to find one")
-    config.gitlab.group = GitlabGroupConfig(group_id)
+    config.gitlab.group = GitlabGroupConfig(group_id,
+                                            concurrency=concurrency,
+                                            refresh_cache=refresh_cache,
+                                            include=include)
 
 
 def sort_members(members):
-    return sorted(members, key=lambda member: member.name)
+    # attrgetter is implemented in C, noticeably faster than a lambda on
+    # thousands of members
+    return sorted(members, key=attrgetter("name"))
+
+
+def merge_members(*member_lists):
+    """Union of member lists, deduplicated on the member id"""
+    result = {}
+    for members in member_lists:
+        for member in members:
+            result.setdefault(member.id, member)
+    return list(result.values())
+
+
+def show_node_members(fields, format, only_explicit, id, name, explicit_members, implicit_members=None):
+    """Show the members of one node of the walk
+
+implicit_members may be a callable, only invoked when the implicit members
+are actually displayed, so that --only-explicit runs don't pay for building
+(or fetching) them at all.
+    """
+    print(f"## Project: {id}: {name}")
+    explicit_members = sort_members(explicit_members)
+    if explicit_members:
+        print("### Explicit members")
+        with TablePrinter(fields, format) as tp:
+            for user in explicit_members:
+                tp.echo(user.id, user.name)
+    else:
+        print("### No explicit members")
+    if not only_explicit:
+        print("### Implicit members")
+        if callable(implicit_members):
+            implicit_members = implicit_members()
+        with TablePrinter(fields, format) as tp:
+            for user in sort_members(implicit_members):
+                tp.echo(user.id, user.name)
 
 
 @group.command()
 @table_format(default='key_value')
-@table_fields(choices=["id", "name"])
+@table_fields(choices=FIELDS_ID_NAME)
 @flag("--only-explicit/--show-implicit", help="Don't show implicit members")
-def walk_members(fields, format, only_explicit):
+@flag("--async/--no-async", "use_async", help="Walk the tree with aiohttp instead of python-gitlab (faster)")
+def walk_members(fields, format, only_explicit, use_async):
     """Recursively walk through all the projects showing the members per group"""
-    for project in config.gitlab.group.walk_group_and_projects():
-        print(f"## Project: {project.id}: {project.name}")
-        explicit_members = sort_members(list(project.members.list(as_list=False)))
-        if explicit_members:
-            print("### Explicit members")
-            with TablePrinter(fields, format) as tp:
-                for user in explicit_members:
-                    tp.echo(user.id, user.name)
-        else:
-            print("### No explicit members")
-        if not only_explicit:
-            print("### Implicit members")
-            with TablePrinter(fields, format) as tp:
-                for user in sort_members(project.members.all(all=True, as_list=False)):
-                    tp.echo(user.id, user.name)
+    with buffered_stdout():
+        if use_async:
+            for node in async_walk_members(config.gitlab.group.group.id,
+                                           concurrency=config.gitlab.group.concurrency,
+                                           only_explicit=only_explicit,
+                                           include=config.gitlab.group.include):
+                show_node_members(fields, format, only_explicit, node.id, node.name, node.explicit_members,
+                                  node.implicit_members)
+            return
+        for group in prefetched(config.gitlab.group.walk_groups()):
+            # the inherited members are the same for every project of a group, so
+            # fetch them once per group instead of calling members/all per project
+            inherited = [] if only_explicit else list(group.members.all(all=True, as_list=False, per_page=PER_PAGE))
+            show_node_members(fields, format, only_explicit, group.id, group.name,
+                              list(group.members.list(as_list=False, per_page=PER_PAGE)), inherited)
+            for project in list_group_projects(group):
+                explicit = list(project.members.list(as_list=False, per_page=PER_PAGE))
+                show_node_members(fields, format, only_explicit, project.id, project.name, explicit,
+                                  lambda explicit=explicit: merge_members(inherited, explicit))
 
 
 @group.command()
 @table_format(default='key_value')
-@table_fields(choices=["name", "members_web_url"])
+@table_fields(choices=FIELDS_NAME_MEMBERS_WEB_URL)
 def walk_project_per_member(fields, format):
     """Like walk_members, but focus on the members
 
@@ -121,75 +695,128 @@ For each member, show the groups that explicitly contain that member.
 This might take a long time, as we need to first span the whole tree of
 groups/project to have the full list of members.
     """
-    project_per_member = defaultdict(list)
+    # flat (member id, node id) pairs plus small id -> attributes side dicts:
+    # this keeps one copy of each name/url however many memberships reference
+    # it, instead of holding full node records per member
+    memberships = []
+    node_meta = {}
+    member_meta = {}
     LOGGER.info("This may take a few minutes, as we scan the whole tree of groups"
                 " to gather all the members. Please be patient.")
     with Spinner():
-        for project in config.gitlab.group.walk_group_and_projects():
-            for member in project.members.list(as_list=False):
-                project_per_member[f"{member.name} ({member.username})"].append(project)
-    for username, groups in sorted(project_per_member.items()):
-        print(f"{username}")
-        for group in sorted(groups, key=lambda group: group.name):
+        for node in config.gitlab.group.walk_group_and_projects_members():
+            node_meta[node.id] = (node.name, node.web_url)
+            for member in node.members:
+                member_meta[member.id] = (member.name, member.username)
+                memberships.append((member.id, node.id))
+
+    def member_title(member_id):
+        name, username = member_meta[member_id]
+        return f"{name} ({username})"
+
+    memberships.sort(key=lambda membership: (member_title(membership[0]), node_meta[membership[1]][0]))
+    with buffered_stdout():
+        for title, member_memberships in groupby(memberships, key=lambda membership: member_title(membership[0])):
+            print(f"{title}")
             with TablePrinter(fields, format) as tp:
-                tp.echo("  " + group.name, group.web_url + "/-/group_members")
+                for _, node_id in member_memberships:
+                    name, web_url = node_meta[node_id]
+                    tp.echo("  " + name, web_url + "/-/group_members")
 
 
 @group.command()
 @table_format(default='key_value')
-@table_fields(choices=["id", "name"])
+@table_fields(choices=FIELDS_ID_NAME)
 @flag("--only-explicit/--show-implicit", help="Don't show implicit members")
 def walk_project_members(fields, format, only_explicit):
     """Recursively walk through all the projects showing the members per group"""
-    for project in config.gitlab.group.walk_projects():
-        print(f"## Project: {project.id}: {project.name}")
-        print("### Explicit members")
-        with TablePrinter(fields, format) as tp:
-            for user in project.members.list(as_list=False):
-                tp.echo(user.id, user.name)
-        if not only_explicit:
-            print("### Implicit members")
+    with buffered_stdout():
+        for project in prefetched(config.gitlab.group.walk_projects()):
+            print(f"## Project: {project.id}: {project.name}")
+            print("### Explicit members")
             with TablePrinter(fields, format) as tp:
-                for user in project.members.all(all=True, as_list=False):
+                for user in project.members.list(as_list=False, per_page=PER_PAGE):
                     tp.echo(user.id, user.name)
+            if not only_explicit:
+                print("### Implicit members")
+                with TablePrinter(fields, format) as tp:
+                    for user in project.members.all(all=True, as_list=False, per_page=PER_PAGE):
+                        tp.echo(user.id, user.name)
 
 
 @gitlab.command()
 @table_format(default='key_value')
-@table_fields(choices=["id", "name"])
+@table_fields(choices=FIELDS_ID_NAME)
 def groups(format, fields):
     """List the available groups"""
     with TablePrinter(fields, format) as tp:
-        for group in config.gitlab.api.groups.list(as_list=False):
+        for group in prefetched(keyset_list(config.gitlab.api.groups)):
             tp.echo(group.id, group.name)
 
 
+class GitlabProjectConfig:
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+
+    @cached_property
+    def project(self):
+        # resolved at most once per run, however many subcommands need it
+        return config.gitlab.api.projects.get(self.project_id)
+
+
 @gitlab.group()
 @option("--project-id", help="The id of the project to consider", required=True)
 def project(project_id):
     """Manipulate project"""
-    config.project_id = project_id
+    config.gitlab.project = GitlabProjectConfig(project_id)
+
+
+def find_last_successful_job(project, job_name):
+    """Find the most recent successful job with the given name
+
+Recent successful jobs live in the most recent successful pipelines, so
+looking there first resolves the job in a couple of requests instead of
+paginating through the whole job history. The resolved job id is memoized so
+repeated lookups within one run are free.
+    """
+    memo = config.gitlab.jobs_memo
+    key = (project.id, job_name)
+    if key not in memo:
+        job = next(
+            (job
+             for pipeline in project.pipelines.list(as_list=False, scope="finished", status="success",
+                                                    per_page=PER_PAGE)
+             for job in pipeline.jobs.list(as_list=False, per_page=PER_PAGE)
+             if job.name == job_name and job.status == "success"),
+            None,
+        )
+        if job is None:
+            raise click.UsageError(f"No successful job named {job_name} in project {project.id}")
+        memo[key] = job.id
+    return project.jobs.get(memo[key], lazy=True)
 
 
 @project.command()
 @argument("job-name", help="The name of the job to download artifacts from")
 def download_artifacts(job_name):
     "Download the last artifact of project generated by the job whose name is given"
-    project = config.gitlab.api.projects.get(config.project_id)
-    job = next(job for job in project.jobs.list(as_list=False, scope=["success"]) if job.name == job_name)
-    Path("artifacts.zip").write_bytes(job.artifacts())
+    project = config.gitlab.project.project
+    job = find_last_successful_job(project, job_name)
+    # stream the artifact to disk so that multi-GB archives don't have to fit
+    # in memory
+    with open("artifacts.zip", "wb") as f:
+        job.artifacts(streamed=True, action=f.write, chunk_size=1024 * 1024)
 
 
 @project.command()
 def list_images():
     """List the docker images"""
     indentation = "  "
-    g = config.gitlab
-    api = g.api
-    project = api.projects.get(config.project_id)
-    for repository in project.repositories.list():
+    project = config.gitlab.project.project
+    for repository in project.repositories.list(per_page=PER_PAGE):
         print(f"{repository.path}:")
-        for tag in repository.tags.list(as_list=False):
+        for tag in repository.tags.list(as_list=False, per_page=PER_PAGE):
             print(indent(tag.path, indentation))
 
 
@@ -204,10 +831,10 @@ def ipython():
     IPython.start_ipython(argv=[], user_ns=dict_)
 
 
-project_member_choice = [
+project_member_choice = (
     'id', 'username', 'name', 'state', 'avatar_url', 'web_url', 'access_level', 'created_at', 'expires_at',
-    'membership_state'
-]
+    'membership_state',
+)
 project_member_access_levels = {
     50: "owner",
     40: "maintainer",
@@ -221,7 +848,7 @@ project_member_access_levels = {
 @table_format(
     default='key_value', )
 @table_fields(
-    choices=project_member_choice + ["access_level_str"],
+    choices=project_member_choice + ('access_level_str', ),
     default=["access_level", "name"],
 )
 @option(
@@ -236,11 +863,9 @@ project_member_access_levels = {
 )
 def members(format, fields, sort_by):
     """List the members"""
-    g = config.gitlab
-    api = g.api
-    project = api.projects.get(config.project_id)
+    project = config.gitlab.project.project
     with TablePrinter(fields, format) as tp:
-        members = project.members_all.list(as_list=False)
+        members = project.members_all.list(as_list=False, per_page=PER_PAGE)
         if sort_by:
             members = sorted(members, key=lambda m: [m.asdict().get(s) for s in sort_by])
         for member in members: